@@ -2,12 +2,172 @@
 # This module manages the database operations for the SQL Playground app.
 # It includes functions to execute SQL queries.
 
+import atexit
+import re
 import sqlite3
+import threading
 import os
 from typing import Any, Union
 
+import pandas as pd
+import pyarrow as pa
+import sqlparse
+import streamlit as st
 from eralchemy2 import render_er
 
+# Connections handed out by get_conn, closed in one sweep at shutdown
+_open_connections: list[sqlite3.Connection] = []
+
+# Cap on rows returned by a SELECT so huge results can't exhaust memory
+MAX_ROWS = 100_000
+
+# How often the pooled connections get a PRAGMA optimize pass, in seconds
+_OPTIMIZE_INTERVAL = 3600.0
+
+
+
+def _tune(conn: sqlite3.Connection, read_only: bool = False) -> None:
+    """
+    Apply performance PRAGMAs to a freshly opened SQLite connection.
+
+    Switches the journal to WAL with relaxed (but still safe) syncing,
+    keeps temporary tables in memory, enlarges the page cache and enables
+    memory-mapped I/O so repeated queries avoid extra fsyncs and disk reads.
+
+    Parameters:
+    - conn (sqlite3.Connection): The connection to tune.
+    - read_only (bool): True for connections opened with mode=ro, which
+      cannot switch the journal mode.
+
+    Returns:
+    - None
+    """
+    if not read_only:
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+    conn.execute("PRAGMA mmap_size=268435456")
+
+
+@st.cache_resource
+def get_conn(db_path: str, read_only: bool = False) -> sqlite3.Connection:
+    """
+    Return a cached, tuned connection to the given SQLite database.
+
+    Streamlit re-runs the script on every interaction; caching the
+    connection keeps SQLite's page cache warm and avoids a file open
+    plus schema re-parse per rerun. Callers must not close the returned
+    connection — all cached connections are closed at shutdown.
+
+    Parameters:
+    - db_path (str): The file path to the SQLite database.
+    - read_only (bool): Open the database in read-only mode.
+
+    Returns:
+    - sqlite3.Connection: A shared connection for this database.
+    """
+    if read_only:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+    _tune(conn, read_only=read_only)
+    _open_connections.append(conn)
+    return conn
+
+
+def evict_connections() -> None:
+    """
+    Close and evict every cached connection.
+
+    Called before a database file is replaced on disk: truncating a file
+    that live WAL connections still hold open would let the next query
+    read stale or corrupt state through the old handles.
+
+    Returns:
+    - None
+    """
+    _close_all_connections()
+    get_conn.clear()
+
+
+def get_schema_version(db_path: str) -> int:
+    """
+    Read the schema_version counter of the given SQLite database.
+
+    SQLite bumps this counter on every DDL change. Unlike the file's
+    modification time, it also moves when commits land in the WAL
+    without rewriting the main database file, which makes it the right
+    invalidation key for anything derived from the schema.
+
+    Parameters:
+    - db_path (str): The file path to the SQLite database.
+
+    Returns:
+    - int: The current schema_version value.
+    """
+    conn = get_conn(db_path, read_only=True)
+    return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+
+def _optimize_connections() -> None:
+    """
+    Periodically run PRAGMA optimize on every pooled connection.
+
+    A long-running Streamlit server never reaches the shutdown sweep, so
+    this hourly pass is what actually lets the query planner refresh its
+    statistics from the session's query history. Reschedules itself on a
+    daemon timer.
+    """
+    for conn in list(_open_connections):
+        try:
+            conn.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            pass  # read-only connections cannot write statistics
+    timer = threading.Timer(_OPTIMIZE_INTERVAL, _optimize_connections)
+    timer.daemon = True
+    timer.start()
+
+
+def _close_all_connections() -> None:
+    """Close every cached connection when the app shuts down."""
+    for conn in _open_connections:
+        try:
+            # Let the query planner refresh its statistics cheaply so the
+            # next session benefits from this one's query history
+            conn.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            pass  # read-only connections cannot write statistics
+        conn.close()
+    _open_connections.clear()
+
+
+atexit.register(_close_all_connections)
+
+_optimize_timer = threading.Timer(_OPTIMIZE_INTERVAL, _optimize_connections)
+_optimize_timer.daemon = True
+_optimize_timer.start()
+
+
+def _is_select(stmt: sqlparse.sql.Statement) -> bool:
+    """
+    Return True when the parsed statement produces result rows.
+
+    get_type() classifies from the token stream and skips leading
+    comments, so '-- header' lines don't hide a SELECT; the first-token
+    check catches CTEs on sqlparse versions that type them as UNKNOWN.
+
+    Parameters:
+    - stmt (sqlparse.sql.Statement): The parsed statement to classify.
+
+    Returns:
+    - bool: Whether executing the statement yields rows to fetch.
+    """
+    if stmt.get_type() == 'SELECT':
+        return True
+    first = stmt.token_first(skip_cm=True)
+    return first is not None and first.normalized == 'WITH'
+
 
 def sql_executor(raw_code: str, db_name: str) -> Union[tuple[list[Any], list[Any]], tuple[list[Any], str], str]:
     """
@@ -25,63 +185,160 @@ def sql_executor(raw_code: str, db_name: str) -> Union[tuple[list[Any], list[Any
     Union[Tuple[List, List], str]: Results for each SELECT query executed or
                              confirmation for non-SELECT queries.
     """
-    conn = sqlite3.connect(os.path.join('data', db_name))
+    conn = get_conn(os.path.join('data', db_name))
     c = conn.cursor()
     try:
-        # Split the input by semicolons to separate individual SQL statements
-        statements = raw_code.strip().split(';')
-
-        # Process each statement
-        for statement in statements:
-            # Skip any empty statements
-            if not statement.strip():
-                continue
-
-            # Execute the statement
-            c.execute(statement.strip())
-
-            # If it's a SELECT statement, fetch results
-            if statement.strip().upper().startswith(('SELECT', 'WITH')):
-                column_names = [desc[0] for desc in c.description]
-                data = c.fetchall()
-                return data, column_names
-
-        # Commit for non-SELECT statements
-        conn.commit()
+        # One transaction per call: committed on success, rolled back on error
+        with conn:
+            # Tokenize into individual statements; unlike split(';') this
+            # also handles semicolons inside string literals
+            statements = sqlparse.parse(raw_code)
+
+            # Process each statement
+            for stmt in statements:
+                statement = str(stmt).strip()
+                # Skip any empty statements
+                if not statement:
+                    continue
+
+                # Execute the statement
+                c.execute(statement)
+
+                # If it's a SELECT statement, fetch results
+                if _is_select(stmt):
+                    column_names = [desc[0] for desc in c.description]
+                    # Fetch in batches rather than materializing the full
+                    # result set, stopping at MAX_ROWS for huge SELECTs
+                    c.arraysize = 1000
+                    data = []
+                    while chunk := c.fetchmany(c.arraysize):
+                        data.extend(chunk)
+                        if len(data) >= MAX_ROWS:
+                            break
+                    return data, column_names
+
         return [], "Executed non-SELECT statement."
 
     except sqlite3.OperationalError as e:
-        conn.rollback()
         return [], f"SQL Error: {e}"
     except Exception as e:
-        conn.rollback()  # Ensure the data is properly rollback
         return [], f"An error occurred: {e}"
-    finally:
-        conn.close()  # Ensure the connection is always closed
 
 
-def generate_er_diagram(database_path: str, selected_db: str) -> str:
+def sql_executor_df(raw_code: str, db_name: str) -> Union[pd.DataFrame, str]:
+    """
+    Execute SQL queries and return SELECT results as a DataFrame.
+
+    SELECT (and WITH) statements are fetched through pandas.read_sql_query,
+    which loads rows column-wise into NumPy arrays instead of building an
+    intermediate list of Python tuples. DML and DDL statements run through
+    the connection directly and return a confirmation or error message.
+
+    Parameters:
+    raw_code (str): SQL query or multiple queries separated by semicolons.
+    db_name (str): Name of the database file to connect to.
+
+    Returns:
+    Union[pd.DataFrame, str]: A DataFrame for the first SELECT executed, or
+                              a confirmation/error message otherwise.
+    """
+    conn = get_conn(os.path.join('data', db_name))
+    try:
+        # One transaction per call: committed on success, rolled back on error
+        with conn:
+            # Tokenize into individual statements; unlike split(';') this
+            # also handles semicolons inside string literals
+            statements = sqlparse.parse(raw_code)
+
+            for stmt in statements:
+                statement = str(stmt).strip()
+                if not statement:
+                    continue
+
+                # SELECT statements are fetched straight into a DataFrame,
+                # streamed in chunks and capped at MAX_ROWS so a huge
+                # result can't exhaust memory
+                if _is_select(stmt):
+                    frames = []
+                    fetched = 0
+                    for frame in pd.read_sql_query(statement, conn, chunksize=10_000):
+                        frames.append(frame)
+                        fetched += len(frame)
+                        if fetched >= MAX_ROWS:
+                            st.warning(f"Result truncated to the first {MAX_ROWS:,} rows.")
+                            break
+                    if not frames:
+                        return pd.DataFrame()
+                    return pd.concat(frames, ignore_index=True).iloc[:MAX_ROWS]
+
+                conn.execute(statement)
+
+        return "Executed non-SELECT statement."
+
+    except sqlite3.OperationalError as e:
+        return f"SQL Error: {e}"
+    except Exception as e:
+        return f"An error occurred: {e}"
+
+
+def sql_executor_arrow(raw_code: str, db_name: str) -> Union[pa.Table, str]:
+    """
+    Execute SQL queries and return SELECT results as an Arrow table.
+
+    Streamlit serializes everything it renders to Arrow IPC, so handing
+    st.dataframe a pyarrow.Table lets it consume the columnar buffers
+    zero-copy instead of converting a DataFrame on every rerun.
+
+    Parameters:
+    raw_code (str): SQL query or multiple queries separated by semicolons.
+    db_name (str): Name of the database file to connect to.
+
+    Returns:
+    Union[pa.Table, str]: An Arrow table for the first SELECT executed, or
+                          a confirmation/error message otherwise.
+    """
+    result = sql_executor_df(raw_code, db_name)
+    if isinstance(result, pd.DataFrame):
+        return pa.Table.from_pandas(result, preserve_index=False)
+    return result
+
+
+@st.cache_data(show_spinner=False)
+def generate_er_diagram(database_path: str, selected_db: str, schema_version: int) -> str:
     """
     Generate an Entity-Relationship diagram for a SQLite database.
 
     This function creates an ER diagram and saves it as a PNG file
     in the specified output directory. It uses ERAlchemy to render
-    the diagram based on the database schema.
+    the diagram based on the database schema. The output file name
+    carries the database's schema version, so a schema change yields
+    a fresh render while unchanged databases reuse the cached image.
 
     Parameters:
     - database_path (str): The path to the SQLite database file.
     - selected_db (str): The name of the selected database.
+    - schema_version (int): The database's schema_version counter, used
+      as the cache invalidation key.
 
     Returns:
     - str: The file path to the saved ER diagram image.
     """
 
     # Define the output path for the ER diagram
-    output_path: str = f'./er_diagram/{selected_db}.png'
+    output_path: str = f'./er_diagram/{selected_db}_{schema_version}.png'
 
     # Create the output directory if it does not exist
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
+    # Remove superseded renders (including pre-versioning ones) so the
+    # directory doesn't grow without bound; the full match keeps renders
+    # of other databases sharing this name as a prefix safe
+    stale_re = re.compile(rf'{re.escape(selected_db)}(_\d+)?\.png')
+    for name in os.listdir('./er_diagram'):
+        stale = f'./er_diagram/{name}'
+        if stale_re.fullmatch(name) and stale != output_path:
+            os.remove(stale)
+
     # Generate the ER diagram using ERAlchemy
     render_er(f'sqlite:///{database_path}', output_path)
 
@@ -1,14 +1,28 @@
 # helper.py
 # This module contains helper functions for the SQL Playground app.
-import sqlite3
+import functools
+import itertools
+import operator
 import os
+import re
+import shutil
+import sqlite3
 
 
-import numpy as np
 import streamlit as st
 import pandas as pd
 from typing import List, Dict, Any
-from PIL import Image
+
+from db_manager import evict_connections, get_conn, get_schema_version
+
+# Maps characters that are unsafe in SQL identifiers to underscores,
+# applied in a single C-level pass via str.translate
+_SANITIZE = str.maketrans({'-': '_', ' ': '_', '.': '_'})
+
+# Matches 'CREATE DATABASE db_name' and captures the database name
+_CREATE_DATABASE_RE = re.compile(
+    r'\s*create\s+database\s+([A-Za-z_][A-Za-z0-9_]*)\s*;?', re.IGNORECASE
+)
 
 
 def list_databases() -> List[str]:
@@ -16,13 +30,21 @@ def list_databases() -> List[str]:
        List all the SQLite database files in the 'data' directory.
 
        This function scans the 'data' directory for files with a '.sqlite' extension
-       and returns their names without the extension.
+       and returns their names without the extension. The listing is cached on
+       the directory's modification time, so reruns only cost a single stat
+       until a database is added or removed.
 
        Returns:
            List[str]: A list of database names without the '.sqlite' extension.
     """
-    # List comprehension to filter and process database files
-    return [f.split(".")[0] for f in os.listdir("data") if f.endswith(".sqlite")]
+    return _list_databases(os.stat("data").st_mtime_ns)
+
+
+@st.cache_data
+def _list_databases(dir_mtime: int) -> List[str]:
+    # scandir avoids building the intermediate name list os.listdir returns
+    with os.scandir("data") as entries:
+        return [entry.name[:-7] for entry in entries if entry.name.endswith(".sqlite")]
 
 
 def get_db_schema(db_path: str) -> Dict[str, List[str]]:
@@ -31,6 +53,8 @@ def get_db_schema(db_path: str) -> Dict[str, List[str]]:
 
         This function connects to the SQLite database at the given path and
         constructs a dictionary that maps table names to a list of their column names.
+        Results are memoized on the database's schema version, so repeated
+        Streamlit reruns skip the reflection until the schema actually changes.
 
         Parameters:
         - db_path (str): The file path to the SQLite database.
@@ -38,24 +62,27 @@ def get_db_schema(db_path: str) -> Dict[str, List[str]]:
         Returns:
         - Dict[str, List[str]]: A dictionary where each key is a table name and each value is a list of column names.
     """
-    # Connect to the database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    return _get_db_schema_cached(db_path, get_schema_version(db_path))
 
-    # Retrieve the list of tables in the database
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = {table[0]: [] for table in cursor.fetchall()}
 
-    # Retrieve the schema for each table
-    for table in tables:
-        cursor.execute(f"PRAGMA table_info({table})")
-        # Extract column names from the table info
-        tables[table] = [column_info[1] for column_info in cursor.fetchall()]
+@functools.lru_cache(maxsize=32)
+def _get_db_schema_cached(db_path: str, schema_version: int) -> Dict[str, List[str]]:
+    # Read-only cached connection so schema reads never contend with WAL writers
+    conn = get_conn(db_path, read_only=True)
+    cursor = conn.cursor()
 
-    # Close the connection to the database
-    conn.close()
+    # Fetch every table's columns in one query instead of a PRAGMA per table
+    cursor.execute(
+        "SELECT m.name, p.name FROM sqlite_master m "
+        "JOIN pragma_table_info(m.name) p "
+        "WHERE m.type='table' ORDER BY m.name, p.cid"
+    )
 
-    return tables
+    # Rows arrive ordered by table, so group consecutively instead of
+    # paying a dictionary lookup per column
+    rows = cursor.fetchall()
+    return {table: [column for _, column in group]
+            for table, group in itertools.groupby(rows, key=operator.itemgetter(0))}
 
 
 def list_database_schema(selected_db_name: str) -> Dict[str, Any]:
@@ -71,9 +98,12 @@ def list_database_schema(selected_db_name: str) -> Dict[str, Any]:
     db_schemas = {}
     db_path = os.path.join("data", f"{selected_db_name}.sqlite")
 
-    # Check if the database file exists and retrieve its schema
-    if os.path.exists(db_path):
+    # get_db_schema opens the database for its cache key anyway, so skip
+    # the separate existence probe and handle a missing database instead
+    try:
         db_schemas[selected_db_name] = get_db_schema(db_path)
+    except sqlite3.OperationalError:
+        pass
 
     return db_schemas
 
@@ -88,15 +118,71 @@ def save_uploaded_file(uploadedfile) -> None:
         Returns:
         - None
     """
-    # Save the file in the 'data' directory
-    with open(os.path.join("data", uploadedfile.name), "wb") as f:
-        f.write(uploadedfile.getbuffer())
+    dest = os.path.join("data", uploadedfile.name)
+
+    # Drop cached connections and stale WAL sidecars before overwriting,
+    # so no pooled handle keeps serving pages from the replaced file
+    evict_connections()
+    for sidecar in (f"{dest}-wal", f"{dest}-shm"):
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+
+    # Stream the upload to disk in 1MB blocks instead of materializing
+    # the whole file in memory first
+    uploadedfile.seek(0)
+    with open(dest, "wb") as f:
+        shutil.copyfileobj(uploadedfile, f, length=1 << 20)
 
     # Notify the user that the file has been saved
     return st.success("Saved File:{} to Data".format(uploadedfile.name))
 
 
-def save_dataframe_to_sqlite(df: pd.DataFrame, db_name: str, table_name: str) -> None:
+def _insert_dataframe(df: pd.DataFrame, table_name: str, conn,
+                      replace: bool = True) -> None:
+    """
+        Insert a DataFrame into a table without committing.
+
+        pandas' to_sql commits inside every call, which defeats batching
+        several writes into one transaction. This path binds the rows with
+        executemany and leaves transaction control entirely to the caller.
+
+        Parameters:
+        - df (pd.DataFrame): The DataFrame to be inserted.
+        - table_name (str): The name of the target table.
+        - conn: An open connection whose transaction the caller manages.
+        - replace (bool): Recreate the table before inserting; False appends
+          to a table created by an earlier chunk.
+
+        Returns:
+        - None
+    """
+    # Open the transaction before any DDL: python's sqlite3 runs DDL in
+    # autocommit mode, so without this the DROP/CREATE would commit on
+    # their own instead of joining the batch
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+
+    if replace:
+        conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        conn.execute(pd.io.sql.get_schema(df, table_name, con=conn))
+
+    # Render datetime-like columns as ISO strings the way pandas' own
+    # SQLite writer does; sqlite3 refuses to bind pd.Timestamp values
+    datelike = df.select_dtypes(include=['datetime', 'datetimetz', 'timedelta']).columns
+    if len(datelike):
+        df = df.copy()
+        for col in datelike:
+            mask = df[col].notna()
+            df[col] = df[col].astype(str).where(mask, None)
+
+    placeholders = ", ".join("?" * len(df.columns))
+    # Cast to native Python objects (NaN becomes None) so sqlite3 can bind them
+    rows = df.astype(object).where(pd.notna(df), None).itertuples(index=False, name=None)
+    conn.executemany(f'INSERT INTO "{table_name}" VALUES ({placeholders})', rows)
+
+
+def save_dataframe_to_sqlite(df: pd.DataFrame, db_name: str, table_name: str,
+                             conn=None) -> None:
     """
         Save a DataFrame to a SQLite database.
 
@@ -107,18 +193,50 @@ def save_dataframe_to_sqlite(df: pd.DataFrame, db_name: str, table_name: str) ->
         - df (pd.DataFrame): The DataFrame to be saved.
         - db_name (str): The name of the SQLite database file.
         - table_name (str): The name of the table where the DataFrame will be stored.
+        - conn: An open connection whose transaction the caller manages; when
+          omitted, the cached connection is used and the write gets its own
+          transaction.
 
         Returns:
         - None
     """
-    # Connect to the SQLite database
-    conn = sqlite3.connect(f"data/{db_name}.sqlite")
+    if conn is not None:
+        # The caller holds the transaction, e.g. one spanning several sheets
+        _insert_dataframe(df, table_name, conn)
+        return
+
+    # Reuse the cached connection for this database
+    conn = get_conn(f"data/{db_name}.sqlite")
 
-    # Write the DataFrame to the specified table
-    df.to_sql(name=table_name, con=conn, if_exists="replace", index=False)
+    # Write the DataFrame inside one explicit transaction
+    with conn:
+        _insert_dataframe(df, table_name, conn)
 
-    # Close the database connection
-    conn.close()
+
+def save_csv_to_sqlite(uploaded_file, db_name: str, table_name: str,
+                       chunksize: int = 50_000) -> None:
+    """
+        Stream a CSV upload into a SQLite table in chunks.
+
+        Instead of loading the whole file into one DataFrame, the CSV is
+        read in fixed-size chunks that are appended to the table as they
+        arrive, keeping peak memory bounded by the chunk size rather than
+        the file size. All chunks commit as a single transaction.
+
+        Parameters:
+        - uploaded_file: The CSV file uploaded by the user.
+        - db_name (str): The name of the SQLite database file.
+        - table_name (str): The name of the table where the data will be stored.
+        - chunksize (int): Number of rows to read per chunk.
+
+        Returns:
+        - None
+    """
+    conn = get_conn(f"data/{db_name}.sqlite")
+
+    with conn:
+        for i, chunk in enumerate(pd.read_csv(uploaded_file, chunksize=chunksize)):
+            _insert_dataframe(chunk, table_name, conn, replace=(i == 0))
 
 
 def process_uploaded_files(uploaded_files: List, same_db: bool) -> None:
@@ -137,27 +255,26 @@ def process_uploaded_files(uploaded_files: List, same_db: bool) -> None:
     """
     if same_db:
         # Process files for the same database
-        db_name = os.path.splitext(uploaded_files[0].name)[0]
-        if '-' in db_name:
-            db_name = db_name.replace('-', '_')
+        db_name = os.path.splitext(uploaded_files[0].name)[0].translate(_SANITIZE)
         # Process each file and save to the same database
         for uploaded_file in uploaded_files:
             try:
                 if uploaded_file.name.endswith((".xls", ".xlsx")):
-                    # Handle Excel files
+                    # Handle Excel files; all sheets commit as one transaction.
+                    # The connection opens lazily here so a .sqlite upload
+                    # doesn't get a WAL-initialized target created under it
                     xls = pd.ExcelFile(uploaded_file)
-                    for sheet_name in xls.sheet_names:
-                        if '-' in sheet_name:
-                            sheet_name = sheet_name.replace('-', '_')
-                        df = pd.read_excel(xls, sheet_name=sheet_name)
-                        save_dataframe_to_sqlite(df, db_name, sheet_name)
+                    conn = get_conn(f"data/{db_name}.sqlite")
+                    with conn:
+                        for sheet_name in xls.sheet_names:
+                            df = pd.read_excel(xls, sheet_name=sheet_name)
+                            save_dataframe_to_sqlite(df, db_name,
+                                                     sheet_name.translate(_SANITIZE),
+                                                     conn=conn)
                 elif uploaded_file.name.endswith(".csv"):
-                    # Handle CSV files
-                    df = pd.read_csv(uploaded_file)
-                    table_name = os.path.splitext(uploaded_file.name)[0]
-                    if '-' in table_name:
-                        table_name = table_name.replace('-', '_')
-                    save_dataframe_to_sqlite(df, db_name, table_name)
+                    # Handle CSV files in chunks to keep memory bounded
+                    table_name = os.path.splitext(uploaded_file.name)[0].translate(_SANITIZE)
+                    save_csv_to_sqlite(uploaded_file, db_name, table_name)
                 elif uploaded_file.name.endswith(".sqlite"):
                     save_uploaded_file(uploaded_file)
                 st.success(f"Saved {uploaded_file.name} to {db_name}.sqlite")
@@ -173,19 +290,14 @@ def process_uploaded_files(uploaded_files: List, same_db: bool) -> None:
                     save_uploaded_file(uploaded_file)
                     st.success(f"Created Database {uploaded_file.name}.sqlite")
                 else:
-                    db_name = os.path.splitext(uploaded_file.name)[0]
-                    if '-' in db_name:
-                        db_name = db_name.replace('-', '_')
-                    # Read file into DataFrame
-                    df = (
-                        pd.read_csv(uploaded_file)
-                        if not uploaded_file.name.endswith((".xls", ".xlsx"))
-                        else pd.read_excel(uploaded_file)
-                    )
-                    # Save to individual database
-                    save_dataframe_to_sqlite(
-                        df, db_name, "table_name"
-                    )
+                    db_name = os.path.splitext(uploaded_file.name)[0].translate(_SANITIZE)
+                    if uploaded_file.name.endswith((".xls", ".xlsx")):
+                        df = pd.read_excel(uploaded_file)
+                        # Save to individual database
+                        save_dataframe_to_sqlite(df, db_name, "table_name")
+                    else:
+                        # Stream CSVs in chunks to keep memory bounded
+                        save_csv_to_sqlite(uploaded_file, db_name, "table_name")
                     st.success(f"Created database {db_name}.sqlite")
             except Exception as e:
                 st.error(f"An error occurred: {e}")
@@ -199,23 +311,21 @@ def handle_create_database_query(query: str, databases_dir: str = "data") -> boo
     :param databases_dir: Directory to store database files.
     :return: Whether a new database was created.
     """
-    if query.lower().startswith("create database"):
-        db_name = query.split()[2]  # Assuming the syntax is 'CREATE DATABASE db_name'
-        if db_name[-1] == ";":
-            db_name = db_name.replace(";", "")
-            db_path = os.path.join(databases_dir, f"{db_name}.sqlite")
-        else:
-            db_path = os.path.join(databases_dir, f"{db_name}.sqlite")
-
-        if not os.path.exists(db_path):
-            # Create a new database file
-            open(db_path, "w").close()
-            return True
+    # Cheap peek at the first few characters so long scripts are never
+    # lowercased or tokenized in full just to dispatch
+    head = query.lstrip()[:15].lower()
+    if not head.startswith("create database"):
+        return False
+
+    # Extract the database name from the token after the keywords
+    match = _CREATE_DATABASE_RE.match(query)
+    if match is None:
+        return False
+
+    db_path = os.path.join(databases_dir, f"{match.group(1)}.sqlite")
+    if not os.path.exists(db_path):
+        # Create a new database file
+        open(db_path, "w").close()
+        return True
 
     return False
-
-
-def encode_image(path: str) -> np.array:
-    if path is not None:
-        image = Image.open(path)
-        return np.array(image)
@@ -2,15 +2,24 @@
 # This script is the main application file for the Streamlit SQL Playground app.
 # It handles the user interface and user interactions.
 
-import pandas as pd
 import streamlit as st
 import sqlparse
 import os
 from streamlit.components.v1 import iframe
 
 from helper import (process_uploaded_files, list_database_schema,
-                    list_databases, handle_create_database_query, encode_image)
-from db_manager import sql_executor, generate_er_diagram
+                    list_databases, handle_create_database_query)
+from db_manager import sql_executor_arrow, generate_er_diagram, get_schema_version
+
+
+@st.cache_data(max_entries=64)
+def format_sql(sql: str) -> str:
+    """
+    Reformat SQL for display, cached so unchanged text is not re-tokenized.
+    """
+    if not sql.strip():
+        return sql
+    return sqlparse.format(sql, reindent=True, keyword_case='upper')
 
 
 def main():
@@ -35,9 +44,19 @@ def main():
         db_files = list_databases()
         selected_db = st.selectbox("Select Database", db_files)
         with st.spinner("Generating ER Diagram..."):
-            diagram_path = os.path.join('er_diagram', f'{selected_db}.png')
+            db_path = os.path.join('data', f'{selected_db}.sqlite')
+            # The diagram file name carries the schema version (WAL commits
+            # don't touch the file's mtime), so a stale image is never
+            # served and an unchanged schema is never re-rendered
+            schema_version = get_schema_version(db_path)
+            diagram_path = os.path.join('er_diagram', f'{selected_db}_{schema_version}.png')
             if not os.path.exists(diagram_path):
-                diagram = generate_er_diagram(os.path.join('data', f'{selected_db}.sqlite'), selected_db)
+                diagram = generate_er_diagram(db_path, selected_db, schema_version)
+                if not os.path.exists(diagram):
+                    # A cached entry can outlive its file; drop the cache
+                    # and render again
+                    generate_er_diagram.clear()
+                    diagram = generate_er_diagram(db_path, selected_db, schema_version)
             else:
                 diagram = diagram_path
         with st.expander("ER Diagram", expanded=True):
@@ -71,42 +90,42 @@ def about_page(choice):
     - Syntax Highlighting
     - Error Detection
     ''', unsafe_allow_html=True)
-    st.image(encode_image('static/img.png'))
+    st.image('static/img.png')
     st.markdown('''
     ### Database Management
     Easily manage your SQLite databases:
     - Create, delete, and modify databases using queries
     - Manage database schemas to which you want to work with using a dropdown list.
     ''')
-    st.image(encode_image('static/img_1.png'))
+    st.image('static/img_1.png')
     st.markdown('''
     ### SQL Script Upload and Execution
     Automate tasks with batch processing:
     - Upload and execute `.sql` scripts
     - Convenient for repetitive database operations
     ''')
-    st.image(encode_image('static/img_2.png'))
+    st.image('static/img_2.png')
     st.markdown('''
     ### Schema Visualization
     Understand and optimize your database structure:
     - Visualize database schemas
     - Explore table relationships
     ''')
-    st.image(encode_image('static/img_3.png'))
+    st.image('static/img_3.png')
     st.markdown('''
     ### Data Table Visualization
     View query results in a user-friendly format:
     - Enhanced data readability
     - Table format for easier analysis
     ''')
-    st.image(encode_image('static/img_4.png'))
+    st.image('static/img_4.png')
     st.markdown('''
     ### File Uploader
     Seamlessly integrate data:
     - Upload `.csv`, `.xls`, `.xlsx`, or `.sqlite` files
     - Create and populate databases from various file formats
     ''')
-    st.image(encode_image('static/img_5.png'))
+    st.image('static/img_5.png')
     st.markdown("Its common to struck in between writing "
                 "queries if you are so then refer the sql cheat "
                 "sheet attached in the SQL Documentation menu item.")
@@ -140,9 +159,9 @@ def home_page(selected_db):
             if sql_script is not None and len(sql_script) > 0:
                 script = sql_script[0].getvalue().decode('utf-8')
                 # Format the script using sqlparse and set it as the default value for the text area
-                raw_code = sqlparse.format(script, reindent=True, keyword_case='upper')
+                raw_code = format_sql(script)
 
-            raw_code = sqlparse.format(st.text_area("Query Here", value=raw_code), reindent=True, keyword_case='upper')
+            raw_code = format_sql(st.text_area("Query Here", value=raw_code))
             # check for the error that form submit button is missing
             submit_code = st.form_submit_button("Execute")
 
@@ -159,25 +178,19 @@ def home_page(selected_db):
                 st.success("Database created successfully.")
             else:
                 st.code(raw_code, language='sql')
-                query_results, column_names = sql_executor(raw_code, f'{selected_db}.sqlite')
-                if isinstance(query_results, list):
+                result = sql_executor_arrow(raw_code, f'{selected_db}.sqlite')
+                if not isinstance(result, str):
                     # Query executed successfully, display results
-                    if column_names:
-                        with st.expander('Results'):
-                            st.write(query_results)
-
-                        with st.expander("Pretty Table Format"):
-                            if len(query_results) > 0 and not None:
-                                query_df = pd.DataFrame(query_results, columns=column_names)
-                                st.dataframe(query_df)
-                            else:
-                                st.error("Please Make sure the query is correct.")
-
-                    else:
-                        st.info(query_results)
-                else:
+                    with st.expander("Pretty Table Format"):
+                        if result.num_rows > 0:
+                            st.dataframe(result)
+                        else:
+                            st.error("Please Make sure the query is correct.")
+                elif result.startswith(("SQL Error", "An error occurred")):
                     # There was an error, display the error message
-                    st.error(query_results)
+                    st.error(result)
+                else:
+                    st.info(result)
 
 
 if __name__ == "__main__":